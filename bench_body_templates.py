@@ -0,0 +1,113 @@
+import argparse
+import logging
+import os
+import shutil
+import tempfile
+
+import body_templates
+import chunk_for_poll
+import get_trainig_data
+
+MEASURES = ['case text bytes', 'document bytes', 'sentences tokenized',
+            'poll sentences']
+
+
+def parseargs():
+    parser = argparse.ArgumentParser(
+        description='Measure how much text the per-domain body templates remove.'
+    )
+    parser.add_argument("-v", "--verbose", help="increase output verbosity",
+                        action="store_true")
+    parser.add_argument("--pages-dir", help="directory of saved pages, laid out as "
+                        "<domain>/<page>.html", required=True)
+    parser.add_argument("--holdout-every", help="hold every Nth page of a domain out of "
+                        "training and measure on those; 0 measures in-sample",
+                        type=int, default=4)
+    args = parser.parse_args()
+    if args.verbose:
+        logging.basicConfig(level=logging.INFO)
+    return args
+
+
+def read_pages(pages_dir):
+    pages = []
+    for domain in sorted(os.listdir(pages_dir)):
+        domain_dir = os.path.join(pages_dir, domain)
+        if not os.path.isdir(domain_dir):
+            continue
+        for name in sorted(os.listdir(domain_dir)):
+            with open(os.path.join(domain_dir, name), 'rb') as f:
+                pages.append(('http://{}/{}'.format(domain, name), f.read()))
+    return pages
+
+
+def count_extractor_input(texts):
+    # What each extractor actually receives from these texts:
+    # get_postive_and_negative_cases scans the texts up to MAX_CASE_TEXT_LENGTH, and
+    # the chunk_for_poll path tokenizes the document made from the longer texts and
+    # hands its poll sentences to find_pollster.
+    import nltk
+    document = chunk_for_poll.get_document_from_texts(texts)
+    return [
+        sum(len(t.encode('utf-8')) for t in texts
+            if len(t) <= get_trainig_data.MAX_CASE_TEXT_LENGTH),
+        len(document),
+        len(nltk.sent_tokenize(document)),
+        len(chunk_for_poll.get_possible_sentences_from_texts(texts))
+    ]
+
+
+def split_pages(pages, holdout_every):
+    # Every holdout_every-th page of each domain is kept out of training.
+    if not holdout_every:
+        return pages, pages
+    train = []
+    test = []
+    index = {}
+    for url, html in pages:
+        domain = body_templates.get_domain(url)
+        index[domain] = index.get(domain, 0) + 1
+        if index[domain] % holdout_every == 0:
+            test.append((url, html))
+        else:
+            train.append((url, html))
+    return train, test
+
+
+def main():
+    args = parseargs()
+    pages = read_pages(args.pages_dir)
+    train, test = split_pages(pages, args.holdout_every)
+
+    # Learn the templates from the training pages first, as a previous crawl would,
+    # then measure on the held out pages.
+    cache_dir = tempfile.mkdtemp()
+    try:
+        templates = body_templates.BodyTemplates(cache_dir)
+        for url, html in train:
+            templates.observe(url, body_templates.texts_with_paths(html))
+
+        full = [0] * len(MEASURES)
+        body = [0] * len(MEASURES)
+        for url, html in test:
+            full_counts = count_extractor_input(list(get_trainig_data.text_from_html(html)))
+            body_counts = count_extractor_input(templates.body_texts(url, html))
+            logging.info('{}: {} -> {}'.format(url, full_counts, body_counts))
+            full = [a + b for a, b in zip(full, full_counts)]
+            body = [a + b for a, b in zip(body, body_counts)]
+    finally:
+        shutil.rmtree(cache_dir)
+
+    if args.holdout_every:
+        print('trained on {} pages, measured on {} held out pages'.format(len(train), len(test)))
+    else:
+        print('trained and measured on the same {} pages (in-sample, optimistic)'.format(
+            len(pages)))
+    for name, f, b in zip(MEASURES, full, body):
+        reduction = 1.0 - float(b) / f if f else 0.0
+        print('{:<24} full: {:>10} body: {:>10} reduction: {:.1%}'.format(
+            name, f, b, reduction))
+
+
+if __name__ == '__main__':
+    main()
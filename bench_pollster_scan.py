@@ -0,0 +1,143 @@
+import argparse
+import logging
+import os
+import timeit
+
+import chunk_for_poll
+
+
+def parseargs():
+    parser = argparse.ArgumentParser(
+        description='Compare the tree walk and array scan pollster searches.'
+    )
+    parser.add_argument("-v", "--verbose", help="increase output verbosity",
+                        action="store_true")
+    parser.add_argument("--pages-dir", help="directory of saved pages, laid out as "
+                        "<domain>/<page>.html", required=True)
+    parser.add_argument("--repeat", help="number of passes over the sentences",
+                        type=int, default=20)
+    args = parser.parse_args()
+    if args.verbose:
+        logging.basicConfig(level=logging.INFO)
+    return args
+
+
+def read_pages(pages_dir):
+    pages = []
+    for domain in sorted(os.listdir(pages_dir)):
+        domain_dir = os.path.join(pages_dir, domain)
+        if not os.path.isdir(domain_dir):
+            continue
+        for name in sorted(os.listdir(domain_dir)):
+            with open(os.path.join(domain_dir, name), 'rb') as f:
+                pages.append(('http://{}/{}'.format(domain, name), f.read()))
+    return pages
+
+
+def tree_search_for_pollster(sentence, poll_idx, search_backwards=True):
+    # The search as it was before the array scan, kept here as the baseline.
+    import nltk
+    if search_backwards:
+        start_idx = poll_idx - 1
+        delta = -1
+        end_idx = -1
+    else:
+        start_idx = poll_idx + 1
+        delta = 1
+        end_idx = len(sentence)
+
+    first_nnp_idx = None
+    last_nnp_idx = None
+    for j in range(start_idx, end_idx, delta):
+        if isinstance(sentence[j], nltk.tree.Tree):
+            if not first_nnp_idx:
+                continue
+            else:
+                break
+        if sentence[j][1] in set(['NNP', 'NNPS']):
+            last_nnp_idx = j
+            if not first_nnp_idx:
+                first_nnp_idx = j
+        else:
+            if not first_nnp_idx:
+                if sentence[j][1] in set(['VBZ', 'VBG', 'VB', 'JJS']):
+                    break
+                else:
+                    continue
+            if sentence[j][1] not in set(['CC']):
+                break
+    if not first_nnp_idx:
+        return None, None
+
+    if not search_backwards:
+        if (last_nnp_idx+1) < (len(sentence)-1):
+            if not isinstance(sentence[j], nltk.tree.Tree) and (
+                        sentence[last_nnp_idx+1][1] in set(['VBD', 'VBZ', 'VBG', 'VB'])):
+                return None, None
+
+    if search_backwards:
+        first_nnp_idx, last_nnp_idx = last_nnp_idx, first_nnp_idx
+    min_dist = min(abs(poll_idx - first_nnp_idx), abs(poll_idx - last_nnp_idx))
+    found_nnp = False
+    for i in range(first_nnp_idx, last_nnp_idx+1):
+        if sentence[i][1] == 'NNP':
+            found_nnp = True
+            break
+    if not found_nnp:
+        return None, None
+
+    pollster = [w[0] for w in [sentence[i] for i in range(first_nnp_idx, last_nnp_idx+1)]]
+    return ' '.join(pollster), min_dist
+
+
+def tree_search(parsed):
+    import nltk
+    results = []
+    for i, word in enumerate(parsed):
+        if isinstance(word, nltk.tree.Tree) and chunk_for_poll.contains_poll_survey(word):
+            results.append(tree_search_for_pollster(parsed, i, search_backwards=True))
+            results.append(tree_search_for_pollster(parsed, i, search_backwards=False))
+    return results
+
+
+def array_search(parsed):
+    encoded = chunk_for_poll.encode_sentence(parsed)
+    results = []
+    for i in encoded.poll_chunks:
+        results.append(chunk_for_poll.scan_for_pollster(encoded, i, search_backwards=True))
+        results.append(chunk_for_poll.scan_for_pollster(encoded, i, search_backwards=False))
+    return results
+
+
+def main():
+    args = parseargs()
+    # Tagging and chunking are done up front, so only the searches are timed.
+    tagger = chunk_for_poll.get_tagger()
+    chunker = chunk_for_poll.get_chunker()
+    parsed_sentences = []
+    for url, html in read_pages(args.pages_dir):
+        for p in chunk_for_poll.get_possible_sentences_from_html(html):
+            parsed_sentences.append(chunker.parse(tagger.tag(p)))
+    logging.info('tagged {} sentences'.format(len(parsed_sentences)))
+
+    mismatches = 0
+    for parsed in parsed_sentences:
+        if tree_search(parsed) != array_search(parsed):
+            mismatches += 1
+            logging.warning('results differ for: {}'.format(parsed))
+
+    tree_time = timeit.timeit(lambda: [tree_search(s) for s in parsed_sentences],
+                              number=args.repeat)
+    array_time = timeit.timeit(lambda: [array_search(s) for s in parsed_sentences],
+                               number=args.repeat)
+
+    print('sentences: {}  passes: {}  mismatches: {}'.format(
+        len(parsed_sentences), args.repeat, mismatches))
+    print('tree walk:  {:.4f}s'.format(tree_time))
+    print('array scan: {:.4f}s'.format(array_time))
+    if array_time:
+        print('speedup:    {:.2f}x'.format(tree_time / array_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+import argparse
+import logging
+import os.path
+import subprocess
+import sys
+import time
+
+ENTRY_POINTS = ['get_trainig_data', 'runner', 'chunk_for_poll', 'classify_texts',
+                'get_pollster_ratings', 'stream_polls']
+
+# Entry points whose first real piece of work needs the nltk models.
+USES_NLTK = set(['chunk_for_poll', 'stream_polls'])
+
+SAMPLE_SENTENCE = ['A', 'new', 'Quinnipiac', 'University', 'poll', 'shows', 'a', 'tight',
+                   'race', '.']
+
+
+def parseargs():
+    parser = argparse.ArgumentParser(
+        description='Compare cold and warm startup time of each entry point.'
+    )
+    parser.add_argument("-v", "--verbose", help="increase output verbosity",
+                        action="store_true")
+    parser.add_argument("--repeat", help="number of runs to average over",
+                        type=int, default=3)
+    args = parser.parse_args()
+    if args.verbose:
+        logging.basicConfig(level=logging.INFO)
+    return args
+
+
+def startup_code(name):
+    # Import the module and, for the nltk users, do the first tagging call, since
+    # that is where the models are actually loaded.
+    code = 'import {}'.format(name)
+    if name in USES_NLTK:
+        code += '; import chunk_for_poll; chunk_for_poll.find_pollster({!r})'.format(
+            SAMPLE_SENTENCE)
+    return code
+
+
+def cold_start(name):
+    # The whole run of a fresh interpreter, as when a script is started by hand.
+    start = time.time()
+    subprocess.check_call([sys.executable, '-c', startup_code(name)],
+                          cwd=os.path.dirname(os.path.abspath(__file__)))
+    return time.time() - start
+
+
+def start_entry_point(name):
+    start = time.time()
+    exec(startup_code(name), {})
+    return time.time() - start
+
+
+def warm_start(pool, name):
+    # The same work in a fresh worker forked from a parent that has preloaded the
+    # nltk models (and so chunk_for_poll and get_trainig_data), but nothing else.
+    return pool.apply(start_entry_point, (name,))
+
+
+def main():
+    args = parseargs()
+
+    # Interpreter startup on its own, for reference.
+    interpreter = sum(cold_start('sys') for _ in range(args.repeat)) / args.repeat
+    results = []
+    for name in ENTRY_POINTS:
+        cold = sum(cold_start(name) for _ in range(args.repeat)) / args.repeat
+        logging.info('{} cold: {:.4f}s'.format(name, cold))
+        results.append([name, cold])
+
+    import chunk_for_poll
+    # One task per worker, so no run sees modules imported by an earlier one.
+    pool = chunk_for_poll.make_worker_pool(1, maxtasksperchild=1)
+    for result in results:
+        name = result[0]
+        warm = sum(warm_start(pool, name) for _ in range(args.repeat)) / args.repeat
+        result.append(warm)
+    pool.close()
+    pool.join()
+
+    print('interpreter startup: {:.4f}s'.format(interpreter))
+    print('{:<22} {:>10} {:>10}'.format('entry point', 'cold (s)', 'warm (s)'))
+    for name, cold, warm in results:
+        print('{:<22} {:>10.4f} {:>10.4f}'.format(name, cold, warm))
+
+
+if __name__ == '__main__':
+    main()
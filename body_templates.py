@@ -0,0 +1,210 @@
+import hashlib
+import json
+import logging
+import os.path
+import threading
+
+try:
+    from urllib.parse import urlparse
+except ImportError:
+    from urlparse import urlparse
+
+import get_trainig_data
+
+DEFAULT_CACHE_DIR = 'body_templates'
+# Pages of a domain needed before we trust its template.
+MIN_PAGES = 3
+# Paths holding mostly text seen on other pages of the site (nav, footers) are boilerplate.
+MAX_REPEATED_FRACTION = 0.5
+# Keep the paths that together hold this much of the site's page-specific text.
+BODY_COVERAGE = 0.8
+# If the body paths hold less than this share of a page's page-specific text, the
+# page doesn't fit the template (e.g. a live blog on a news site) and all text is kept.
+MIN_BODY_SHARE = 0.5
+# Learning looks at everything recorded for a domain, so it is redone each time the
+# page count doubles, and at least this often once the domain is established.
+RELEARN_PAGES = 20
+# Text seen on only one page, and crawled urls, are forgotten after this many pages,
+# so the stats for a domain stop growing with every article.
+KEEP_PAGES = 200
+
+
+def get_domain(url):
+    domain = urlparse(url).netloc.lower()
+    if domain.startswith('www.'):
+        domain = domain[4:]
+    return domain
+
+
+def dom_path(element):
+    # Tag names and classes from the root down, e.g. 'html/body/div.story-body/p'.
+    # Positions and ids are left out since they change from page to page.
+    names = []
+    for parent in element.parents:
+        if parent.name == '[document]':
+            break
+        classes = parent.get('class') or []
+        names.append('.'.join([parent.name] + sorted(classes)))
+    return '/'.join(reversed(names))
+
+
+def texts_with_paths(body):
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(body, 'html.parser')
+    paths = {}
+    result = []
+    for text in filter(get_trainig_data.tag_visible, soup.findAll(text=True)):
+        # Most text nodes share their parent with others, so only walk it once.
+        parent_id = id(text.parent)
+        if parent_id not in paths:
+            paths[parent_id] = dom_path(text)
+        result.append((paths[parent_id], text))
+    return result
+
+
+def text_hash(text):
+    return hashlib.md5(text.strip().encode('utf-8')).hexdigest()
+
+
+def prune_stats(stats):
+    oldest = stats['pages'] - KEEP_PAGES
+    for url_hash, page in list(stats['urls'].items()):
+        if page <= oldest:
+            del stats['urls'][url_hash]
+    for path, texts in list(stats['paths'].items()):
+        for h, (page_count, _, first_page) in list(texts.items()):
+            if page_count == 1 and first_page <= oldest:
+                del texts[h]
+        if not texts:
+            del stats['paths'][path]
+
+
+def next_learn_at(learned_at):
+    return learned_at + min(max(learned_at, 1), RELEARN_PAGES)
+
+
+def page_specific_chars(stats, texts, body_paths):
+    # Characters of this page's text seen on no other page, overall and on body paths.
+    total = 0
+    in_body = 0
+    for path, text in texts:
+        length = len(text.strip())
+        if not length:
+            continue
+        entry = stats['paths'].get(path, {}).get(text_hash(text))
+        if entry is None or entry[0] == 1:
+            total += length
+            if path in body_paths:
+                in_body += length
+    return total, in_body
+
+
+def learn_body_paths(stats):
+    if stats['pages'] < MIN_PAGES:
+        return None
+    # For each path, how much of its text shows up on only one page.
+    unique_chars = {}
+    for path, texts in stats['paths'].items():
+        unique = 0
+        repeated = 0
+        for page_count, length, _ in texts.values():
+            if page_count == 1:
+                unique += length
+            else:
+                repeated += length
+        if unique and repeated <= MAX_REPEATED_FRACTION * (unique + repeated):
+            unique_chars[path] = unique
+    total = sum(unique_chars.values())
+    body_paths = []
+    covered = 0
+    for path in sorted(unique_chars, key=unique_chars.get, reverse=True):
+        if covered >= BODY_COVERAGE * total:
+            break
+        body_paths.append(path)
+        covered += unique_chars[path]
+    return set(body_paths)
+
+
+class BodyTemplates(object):
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.stats = {}
+        # domain -> (body paths, number of pages they were learned from)
+        self.body_paths = {}
+        self.dirty = set()
+        # body_texts runs on the stream's extractor thread while save may not.
+        self.lock = threading.Lock()
+
+    def get_filename(self, domain):
+        return os.path.join(self.cache_dir, '{}.json'.format(domain))
+
+    def get_stats(self, domain):
+        if domain not in self.stats:
+            filename = self.get_filename(domain)
+            if os.path.exists(filename):
+                with open(filename) as f:
+                    self.stats[domain] = json.load(f)
+            else:
+                self.stats[domain] = {'domain': domain, 'pages': 0, 'urls': {}, 'paths': {}}
+        return self.stats[domain]
+
+    def observe(self, url, texts):
+        # Record which text appeared under which path, counting each text once per page.
+        # A page crawled twice would make its own body look repeated, so skip it.
+        domain = get_domain(url)
+        stats = self.get_stats(domain)
+        url_hash = text_hash(url)
+        if url_hash in stats['urls']:
+            return
+        stats['pages'] += 1
+        stats['urls'][url_hash] = stats['pages']
+        seen = set()
+        for path, text in texts:
+            length = len(text.strip())
+            if not length:
+                continue
+            h = text_hash(text)
+            if (path, h) in seen:
+                continue
+            seen.add((path, h))
+            path_texts = stats['paths'].setdefault(path, {})
+            if h in path_texts:
+                path_texts[h][0] += 1
+            else:
+                path_texts[h] = [1, length, stats['pages']]
+        self.dirty.add(domain)
+
+    def get_body_paths(self, domain):
+        stats = self.get_stats(domain)
+        body_paths, learned_at = self.body_paths.get(domain, (None, 0))
+        if body_paths is None or stats['pages'] >= next_learn_at(learned_at):
+            prune_stats(stats)
+            body_paths = learn_body_paths(stats)
+            self.body_paths[domain] = (body_paths, stats['pages'])
+        return body_paths
+
+    def body_texts(self, url, html):
+        # Falls back to every visible text until the domain has enough pages, and for
+        # pages whose layout the template doesn't fit.
+        domain = get_domain(url)
+        texts = texts_with_paths(html)
+        with self.lock:
+            self.observe(url, texts)
+            body_paths = self.get_body_paths(domain)
+            if body_paths:
+                total, in_body = page_specific_chars(self.stats[domain], texts, body_paths)
+        if not body_paths or in_body < MIN_BODY_SHARE * total:
+            return [text for _, text in texts]
+        return [text for path, text in texts if path in body_paths]
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            if not os.path.exists(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            for domain in self.dirty:
+                logging.info('saving body template for {}'.format(domain))
+                with open(self.get_filename(domain), 'w') as f:
+                    json.dump(self.stats[domain], f)
+            self.dirty = set()
@@ -1,20 +1,108 @@
 import csv
-import requests
-import nltk
-from unidecode import unidecode
+import multiprocessing
+from array import array
+from collections import namedtuple
 
 import get_trainig_data
 
+NP_GRAMMAR = "NP: {<DT>?<JJ>*<NN>}"
+# Shorter texts are mostly captions, links and bylines rather than prose.
+MIN_SENTENCE_TEXT_LENGTH = 100
+
+# nltk and its models are slow to load, so they are only loaded on first use and
+# then kept for the life of the process (see preload_models and make_worker_pool).
+_tagger = None
+_chunker = None
+
+
+def get_tagger():
+    global _tagger
+    if _tagger is None:
+        # nltk.pos_tag builds a new PerceptronTagger (and unpickles it) on every call.
+        from nltk.tag.perceptron import PerceptronTagger
+        _tagger = PerceptronTagger()
+    return _tagger
+
+
+def get_chunker():
+    global _chunker
+    if _chunker is None:
+        import nltk
+        _chunker = nltk.RegexpParser(NP_GRAMMAR)
+    return _chunker
+
+
+def preload_models():
+    import nltk
+    get_tagger()
+    get_chunker()
+    # nltk caches the punkt tokenizer after the first load.
+    nltk.word_tokenize('Preload the punkt models.')
+
+
+def make_worker_pool(processes=None, maxtasksperchild=None):
+    # Load the models before forking so the workers share them copy-on-write
+    # instead of each worker loading its own copy on its first task.
+    preload_models()
+    if hasattr(multiprocessing, 'get_context'):
+        return multiprocessing.get_context('fork').Pool(processes,
+                                                        maxtasksperchild=maxtasksperchild)
+    return multiprocessing.Pool(processes, maxtasksperchild=maxtasksperchild)
+
+
+POLL_WORDS = frozenset(['poll', 'survey'])
+
+# Tagged sentences are scanned as arrays of small integer codes rather than as
+# nltk trees. Every tag the scan doesn't care about is OTHER, and a whole chunk
+# (noun phrase) takes up a single CHUNK entry, which is where its boundaries are.
+OTHER, NNP, NNPS, CC, VB, VBD, VBG, VBZ, JJS, CHUNK = range(10)
+TAG_CODES = {'NNP': NNP, 'NNPS': NNPS, 'CC': CC, 'VB': VB, 'VBD': VBD, 'VBG': VBG,
+             'VBZ': VBZ, 'JJS': JJS}
+
+
+def code_table(codes):
+    table = array('b', [0] * (CHUNK + 1))
+    for c in codes:
+        table[c] = 1
+    return table
+
+
+IS_PROPER = code_table([NNP, NNPS])
+# Don't allow verbs in between poll and pollster (allow VBD)
+# Don't allow JJS (maybe not JJR, JJ)
+STOPS_BEFORE_PROPER = code_table([VBZ, VBG, VB, JJS])
+VERB_AFTER_PROPER = code_table([VBD, VBZ, VBG, VB])
+
+EncodedSentence = namedtuple('EncodedSentence', ['parsed', 'codes', 'words', 'poll_chunks'])
+
 
 def contains_poll_survey(noun_phrase):
     # Notes: could disallow 'JJ' in the phrase...
     for word in noun_phrase:
-        if word[0] in set(['poll', 'survey']) and word[1] == 'NN':
+        if word[0] in POLL_WORDS and word[1] == 'NN':
             return True
     return False
 
 
-def search_for_pollster(sentence, poll_idx, search_backwards=True, extra_logging=False):
+def encode_sentence(parsed):
+    # Tagged words are (word, tag) tuples, anything else is a chunk.
+    codes = array('b')
+    words = []
+    poll_chunks = []
+    for i, token in enumerate(parsed):
+        if isinstance(token, tuple):
+            codes.append(TAG_CODES.get(token[1], OTHER))
+            words.append(token[0])
+        else:
+            codes.append(CHUNK)
+            words.append(None)
+            if contains_poll_survey(token):
+                poll_chunks.append(i)
+    return EncodedSentence(parsed, codes, words, poll_chunks)
+
+
+def scan_for_pollster(encoded, poll_idx, search_backwards=True, extra_logging=False):
+    codes = encoded.codes
     if search_backwards:
         start_idx = poll_idx - 1
         delta = -1
@@ -22,7 +110,7 @@ def search_for_pollster(sentence, poll_idx, search_backwards=True, extra_logging
     else:
         start_idx = poll_idx + 1
         delta = 1
-        end_idx = len(sentence)
+        end_idx = len(codes)
 
     first_nnp_idx = None
     last_nnp_idx = None
@@ -33,38 +121,32 @@ def search_for_pollster(sentence, poll_idx, search_backwards=True, extra_logging
 
     for j in range(start_idx, end_idx, delta):
         if extra_logging:
-            print(sentence[j])
-        if isinstance(sentence[j], nltk.tree.Tree):
+            print(encoded.parsed[j])
+        code = codes[j]
+        if code == CHUNK:
             if not first_nnp_idx:
                 continue
             else:
                 break
-        if sentence[j][1] in set(['NNP', 'NNPS']):
+        if IS_PROPER[code]:
             last_nnp_idx = j
             if not first_nnp_idx:
                 first_nnp_idx = j
-        else:
-            if not first_nnp_idx:
-                # Don't allow verbs in between poll and pollster (allow VBD)
-                # Don't allow JJS (maybe not JJR, JJ)
-                if sentence[j][1] in set(['VBZ', 'VBG', 'VB', 'JJS']):
-                    break
-                else:
-                    continue
-            if sentence[j][1] not in set(['CC']):
+        elif not first_nnp_idx:
+            if STOPS_BEFORE_PROPER[code]:
                 break
+        elif code != CC:
+            break
     if not first_nnp_idx:
         if extra_logging:
             print('unable to find an NNP or NNPS')
         return None, None
 
     if not search_backwards:
-        if (last_nnp_idx+1) < (len(sentence)-1):
-            if not isinstance(sentence[j], nltk.tree.Tree) and (
-                        sentence[last_nnp_idx+1][1] in set(['VBD', 'VBZ', 'VBG', 'VB'])):
-                if extra_logging:
-                    print('found verb directly after NNP phrase')
-                return None, None
+        if (last_nnp_idx+1) < (len(codes)-1) and VERB_AFTER_PROPER[codes[last_nnp_idx+1]]:
+            if extra_logging:
+                print('found verb directly after NNP phrase')
+            return None, None
 
     if extra_logging:
         print('indicies: {} {}'.format(first_nnp_idx, last_nnp_idx+1))
@@ -73,25 +155,23 @@ def search_for_pollster(sentence, poll_idx, search_backwards=True, extra_logging
     # Make sure that the phrase isn't too far from poll.
     min_dist = min(abs(poll_idx - first_nnp_idx), abs(poll_idx - last_nnp_idx))
     # Make sure there is at least one NNP in the phrase
-    found_nnp = False
-    for i in range(first_nnp_idx, last_nnp_idx+1):
-        if sentence[i][1] == 'NNP':
-            found_nnp = True
-            break
-    if not found_nnp:
+    if NNP not in codes[first_nnp_idx:last_nnp_idx+1]:
         return None, None
 
-    pollster = [w[0] for w in [sentence[i] for i in range(first_nnp_idx, last_nnp_idx+1)]]
-    return ' '.join(pollster), min_dist
+    return ' '.join(encoded.words[first_nnp_idx:last_nnp_idx+1]), min_dist
+
+
+def search_for_pollster(sentence, poll_idx, search_backwards=True, extra_logging=False):
+    return scan_for_pollster(encode_sentence(sentence), poll_idx,
+                             search_backwards=search_backwards, extra_logging=extra_logging)
 
 
 def find_pollster(p, extra_logging=False):
-    grammar = "NP: {<DT>?<JJ>*<NN>}"
-    cp = nltk.RegexpParser(grammar)
-    parsed = cp.parse(nltk.pos_tag(p))
+    parsed = get_chunker().parse(get_tagger().tag(p))
     if extra_logging:
         print('=============')
         print(parsed)
+    encoded = encode_sentence(parsed)
     pollster = None
     # The algorithm is:
     # 1) Try to find a noun phrase (NP) with poll or survey in it (as a common noun NN)
@@ -99,41 +179,63 @@ def find_pollster(p, extra_logging=False):
     #   a) Limit how far forward (and backward) to search  (TODO)
     #   b) Find a good heuristic for other parts of speech that can be part of the NNP
 
-    for i, word in enumerate(parsed):
-        if isinstance(word, nltk.tree.Tree):
-            # We're looking for Noun Phrases with the word poll or survey in it
-            if contains_poll_survey(word):
-                # Back track to find the polling firm
-                if extra_logging:
-                    print('searching for pollster')
-                b_pollster, b_distance = search_for_pollster(
-                    parsed, i, search_backwards=True, extra_logging=extra_logging)
-                f_pollster, f_distance = search_for_pollster(
-                    parsed, i, search_backwards=False, extra_logging=extra_logging)
-
-                if not b_pollster and not f_pollster:
-                    continue
-                if not b_pollster and f_pollster:
-                    pollster = f_pollster
-                    break
-                if b_pollster and not f_pollster:
-                    pollster = b_pollster
-                    break
-
-                if b_distance <= f_distance:
-                    pollster = b_pollster
-                    break
-                else:
-                    pollster = f_pollster
-                    break
+    # We're looking for Noun Phrases with the word poll or survey in it
+    for i in encoded.poll_chunks:
+        # Back track to find the polling firm
+        if extra_logging:
+            print('searching for pollster')
+        b_pollster, b_distance = scan_for_pollster(
+            encoded, i, search_backwards=True, extra_logging=extra_logging)
+        f_pollster, f_distance = scan_for_pollster(
+            encoded, i, search_backwards=False, extra_logging=extra_logging)
+
+        if not b_pollster and not f_pollster:
+            continue
+        if not b_pollster and f_pollster:
+            pollster = f_pollster
+            break
+        if b_pollster and not f_pollster:
+            pollster = b_pollster
+            break
+
+        if b_distance <= f_distance:
+            pollster = b_pollster
+            break
+        else:
+            pollster = f_pollster
+            break
     return pollster
 
 
-def get_possible_sentences_from_url(url):
+def find_pollsters(sentences, pool=None):
+    if pool is None:
+        return [find_pollster(p) for p in sentences]
+    return pool.map(find_pollster, sentences)
+
+
+def get_possible_sentences_from_url(url, templates=None):
+    import requests
     content = requests.get(url).content
-    texts = get_trainig_data.text_from_html(content)
-    prob_texts = [t for t in texts if len(t) > 100]
-    document = unidecode(''.join(prob_texts))
+    return get_possible_sentences_from_html(content, url=url, templates=templates)
+
+
+def get_possible_sentences_from_html(content, url=None, templates=None):
+    if templates is not None:
+        texts = templates.body_texts(url, content)
+    else:
+        texts = get_trainig_data.text_from_html(content)
+    return get_possible_sentences_from_texts(texts)
+
+
+def get_document_from_texts(texts):
+    from unidecode import unidecode
+    prob_texts = [t for t in texts if len(t) > MIN_SENTENCE_TEXT_LENGTH]
+    return unidecode(''.join(prob_texts))
+
+
+def get_possible_sentences_from_texts(texts):
+    import nltk
+    document = get_document_from_texts(texts)
     sentences = nltk.sent_tokenize(document)
 
     sentences_pos = [nltk.word_tokenize(sent) for sent in sentences]
@@ -1,8 +1,6 @@
 import argparse
 import csv
 import logging
-import requests
-from bs4 import BeautifulSoup
 
 MAX_RESULTS_FROM_QUERY = 700
 RESULTS_PER_PAGE = 100
@@ -30,6 +28,8 @@ def parseargs():
 
 
 def main():
+    import requests
+    from bs4 import BeautifulSoup
     args = parseargs()
     logging.info('starting...')
     r = requests.get(args.url, headers=HEADERS)
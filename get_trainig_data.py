@@ -2,16 +2,13 @@ import argparse
 import csv
 import logging
 import json
-import twitter
-import requests
 import os.path
 import time
 
-from bs4 import BeautifulSoup
-from bs4.element import Comment
-
 MAX_RESULTS_FROM_QUERY = 100000
 RESULTS_PER_PAGE = 100
+# Longer texts are whole articles run together, not a single statement about a poll.
+MAX_CASE_TEXT_LENGTH = 1000
 
 HEADERS = {
     'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_10_1) '
@@ -33,6 +30,8 @@ def parseargs():
                         required=True)
     parser.add_argument("--negative-output", help="csv file to write with negative cases",
                         required=True)
+    parser.add_argument("--body-templates", help="directory to cache per-domain article "
+                        "body templates in; when unset every visible text is scanned")
     args = parser.parse_args()
     if args.verbose:
         logging.basicConfig(level=logging.INFO)
@@ -44,6 +43,7 @@ def get_filename(term, since, until):
 
 
 def read_queries_from_file(filename):
+    import twitter
     with open(filename, 'rb') as f:
         file_dict = json.load(f)
     all_results = []
@@ -100,7 +100,8 @@ def paginated_query(api, term, since=None, until=None, use_cache=False, be_nice=
     return all_pages
 
 
-def expand_url_if_short(url):
+def expand_url_if_short(url, timeout=None):
+    import requests
     new_url = None
     try:
         min_url_length = 30
@@ -108,7 +109,7 @@ def expand_url_if_short(url):
             return url
         # Use requests to send a get request to the url and return the real url.
         logging.info('short url: {}'.format(url))
-        new_url = requests.get(url, headers=HEADERS).url
+        new_url = requests.get(url, headers=HEADERS, timeout=timeout).url
         if len(new_url) < min_url_length:
             logging.warning('Unable to expand url: ({}, {})'.format(url, new_url))
     except requests.exceptions.SSLError:
@@ -116,12 +117,18 @@ def expand_url_if_short(url):
     return new_url
 
 
-def get_non_twitter_urls(urls_class):
+def get_non_twitter_urls(urls_class, timeout=None):
+    if not urls_class:
+        return []
+    return filter_non_twitter_urls([u.expanded_url for u in urls_class], timeout=timeout)
+
+
+def filter_non_twitter_urls(expanded_urls, timeout=None):
     blacklist = ['twitter.com', 'youtube.com']
     urls = []
-    if urls_class:
-        for url_class in urls_class:
-            long_url = expand_url_if_short(url_class.expanded_url)
+    if expanded_urls:
+        for expanded_url in expanded_urls:
+            long_url = expand_url_if_short(expanded_url, timeout=timeout)
             if not long_url:
                 continue
             blacklisted = False
@@ -156,14 +163,18 @@ def get_pollsters_from_file(filename):
     return pollsters
 
 
-def get_postive_and_negative_cases(html, pollsters, heavy_logging=False):
+def get_postive_and_negative_cases(html, pollsters, heavy_logging=False, url=None,
+                                   templates=None):
     pos_cases = []
     neg_cases = []
-    texts = text_from_html(html)
+    if templates is not None:
+        texts = templates.body_texts(url, html)
+    else:
+        texts = text_from_html(html)
     if heavy_logging:
         logging.info('--------------------------\n--------------------------')
     for text in texts:
-        if len(text) > 1000:
+        if len(text) > MAX_CASE_TEXT_LENGTH:
             continue
         if heavy_logging:
             logging.info(text)
@@ -184,6 +195,7 @@ def get_postive_and_negative_cases(html, pollsters, heavy_logging=False):
 
 
 def tag_visible(element):
+    from bs4.element import Comment
     if element.parent.name in ['style', 'script', 'head', 'title', 'meta', '[document]']:
         return False
     if isinstance(element, Comment):
@@ -192,6 +204,7 @@ def tag_visible(element):
 
 
 def text_from_html(body):
+    from bs4 import BeautifulSoup
     soup = BeautifulSoup(body, 'html.parser')
     texts = soup.findAll(text=True)
     visible_texts = filter(tag_visible, texts)
@@ -199,12 +212,18 @@ def text_from_html(body):
 
 
 def main():
+    import twitter
+    import requests
     args = parseargs()
     logging.info('starting...')
     with open(args.secret_file) as f:
         secrets = json.load(f)
 
     pollsters = get_pollsters_from_file(args.pollster_csv)
+    templates = None
+    if args.body_templates:
+        import body_templates
+        templates = body_templates.BodyTemplates(args.body_templates)
     api = twitter.Api(consumer_key=secrets['APIKey'],
                       consumer_secret=secrets['APISecret'],
                       access_token_key=secrets['AccessToken'],
@@ -225,7 +244,8 @@ def main():
                 for u in urls:
                     try:
                         content = requests.get(u, headers=HEADERS).content
-                        pos_cases, neg_cases = get_postive_and_negative_cases(content, pollsters)
+                        pos_cases, neg_cases = get_postive_and_negative_cases(
+                            content, pollsters, url=u, templates=templates)
                         all_positive_cases += pos_cases
                         all_negative_cases += neg_cases
                     except requests.exceptions.SSLError:
@@ -238,6 +258,8 @@ def main():
                 logging.info(u'user name: {}'.format(result.user.name))
                 logging.info(u'tweet id: {}'.format(result.id))
                 logging.info(u'retweet status: {}'.format(result.retweeted_status is not None))
+    if templates is not None:
+        templates.save()
 
     logging.info(len(all_positive_cases), len(all_negative_cases))
     for p in all_positive_cases:
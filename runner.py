@@ -1,10 +1,7 @@
 import argparse
 import logging
 import json
-import twitter
-import requests
 import os.path
-from bs4 import BeautifulSoup
 
 MAX_RESULTS_FROM_QUERY = 700
 RESULTS_PER_PAGE = 100
@@ -34,6 +31,7 @@ def get_filename(term, since, until):
 
 
 def read_queries_from_file(filename):
+    import twitter
     with open(filename, 'rb') as f:
         file_dict = json.load(f)
     all_results = []
@@ -88,6 +86,7 @@ def paginated_query(api, term, since=None, until=None, use_cache=False):
 
 
 def expand_url_if_short(url):
+    import requests
     min_url_length = 30
     if len(url) >= min_url_length:
         return url
@@ -119,6 +118,7 @@ def find_polling_firms_from_p(p):
 
 
 def find_polling_firm_from_html(html):
+    from bs4 import BeautifulSoup
     polling_firms = []
     bs = BeautifulSoup(html, 'html.parser')
     for p in bs.find_all('p'):
@@ -127,6 +127,8 @@ def find_polling_firm_from_html(html):
 
 
 def main():
+    import twitter
+    import requests
     args = parseargs()
     logging.info('starting...')
     with open(args.secret_file) as f:
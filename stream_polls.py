@@ -0,0 +1,420 @@
+import argparse
+import json
+import logging
+import threading
+import time
+from collections import deque
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+import body_templates
+import chunk_for_poll
+import get_trainig_data
+
+QUEUE_SIZE = 100
+NUM_URL_WORKERS = 2
+NUM_FETCH_WORKERS = 8
+TARGET_LATENCY_SECONDS = 30.0
+METRICS_INTERVAL_SECONDS = 10.0
+TEMPLATE_SAVE_SECONDS = 60.0
+FOLLOW_POLL_SECONDS = 1.0
+LATENCY_WINDOW = 10000
+FETCH_CHUNK_SIZE = 64 * 1024
+# Time still allowed for expanding or fetching an item that is already late.
+LATE_TIMEOUT_SECONDS = 10.0
+MIN_BACKOFF_SECONDS = 1.0
+MAX_BACKOFF_SECONDS = 300.0
+
+# Put on a queue once per consumer to tell it that no more work is coming.
+STOP = None
+
+
+def parseargs():
+    parser = argparse.ArgumentParser(
+        description='Stream tweets and write pollster detections as JSONL.'
+    )
+    parser.add_argument("-v", "--verbose", help="increase output verbosity",
+                        action="store_true")
+    parser.add_argument("--secret-file", help="json file with twitter secrets")
+    parser.add_argument("--feed-file", help="JSONL file of tweets to use instead of twitter")
+    parser.add_argument("--follow", help="keep reading the feed file as it grows",
+                        action="store_true")
+    parser.add_argument("--term", help="term to track on the twitter stream",
+                        default='new poll')
+    parser.add_argument("--output", help="JSONL file to write pollster detections",
+                        required=True)
+    parser.add_argument("--metrics-file", help="json file to write queue and latency metrics")
+    parser.add_argument("--target-latency", help="seconds allowed from tweet to detection",
+                        type=float, default=TARGET_LATENCY_SECONDS)
+    parser.add_argument("--queue-size", help="max items waiting between stages",
+                        type=int, default=QUEUE_SIZE)
+    parser.add_argument("--fetch-workers", help="number of concurrent page fetches",
+                        type=int, default=NUM_FETCH_WORKERS)
+    parser.add_argument("--body-templates", help="directory to cache per-domain article "
+                        "body templates in; when unset every visible text is scanned")
+    parser.add_argument("--drop-late", help="drop tweets that go over the target latency "
+                        "and write them to this JSONL file, which can be replayed with "
+                        "--feed-file; by default late tweets are processed and marked late")
+    parser.add_argument("--extract-processes", help="size of the preloaded extraction pool",
+                        type=int, default=0)
+    args = parser.parse_args()
+    if not args.secret_file and not args.feed_file:
+        parser.error('one of --secret-file or --feed-file is required')
+    if args.verbose:
+        logging.basicConfig(level=logging.INFO)
+    return args
+
+
+def twitter_feed(api, term, max_retries=None):
+    # Each item is the raw tweet dict from the streaming API. The stream drops on
+    # network errors and twitter disconnects, so reconnect with exponential backoff.
+    backoff = MIN_BACKOFF_SECONDS
+    retries = 0
+    while True:
+        try:
+            for tweet in api.GetStreamFilter(track=[term]):
+                if 'disconnect' in tweet:
+                    logging.warning('twitter disconnected the stream: {}'.format(tweet))
+                    break
+                if 'id' not in tweet:
+                    # Limit notices and other control messages.
+                    continue
+                backoff = MIN_BACKOFF_SECONDS
+                retries = 0
+                yield tweet
+        except Exception:
+            logging.exception('twitter stream failed')
+        if max_retries is not None and retries >= max_retries:
+            logging.error('giving up on the twitter stream after {} retries'.format(retries))
+            return
+        logging.info('reconnecting to the twitter stream in {}s'.format(backoff))
+        time.sleep(backoff)
+        backoff = min(backoff * 2, MAX_BACKOFF_SECONDS)
+        retries += 1
+
+
+def file_feed(filename, follow=False):
+    # Local stand-in for the twitter stream: one tweet dict per line.
+    with open(filename) as f:
+        while True:
+            line = f.readline()
+            if not line:
+                if not follow:
+                    return
+                time.sleep(FOLLOW_POLL_SECONDS)
+                continue
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+class StreamMetrics(object):
+    def __init__(self, target_latency, window=LATENCY_WINDOW):
+        self.target_latency = target_latency
+        self.lock = threading.Lock()
+        self.queues = {}
+        self.counts = {'tweets': 0, 'urls': 0, 'pages': 0, 'detections': 0,
+                       'fetch_errors': 0, 'errors': 0, 'over_target': 0, 'dropped': 0}
+        # Percentiles come from the most recent latencies only, so a long running
+        # stream doesn't grow memory or the cost of a snapshot.
+        self.latencies = deque(maxlen=window)
+        self.latency_count = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+
+    def add_queue(self, name, q):
+        self.queues[name] = q
+
+    def incr(self, name, n=1):
+        with self.lock:
+            self.counts[name] += n
+
+    def record_latency(self, latency):
+        with self.lock:
+            self.latencies.append(latency)
+            self.latency_count += 1
+            self.latency_sum += latency
+            self.latency_max = max(self.latency_max, latency)
+            if latency > self.target_latency:
+                self.counts['over_target'] += 1
+
+    def snapshot(self):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            d = {'time': time.time(),
+                 'target_latency': self.target_latency,
+                 'queue_depth': dict((name, q.qsize()) for name, q in self.queues.items())}
+            d.update(self.counts)
+            if latencies:
+                d['latency'] = {
+                    'count': self.latency_count,
+                    'mean': self.latency_sum / self.latency_count,
+                    'max': self.latency_max,
+                    'window': len(latencies),
+                    'p50': latencies[len(latencies) // 2],
+                    'p95': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+                }
+        return d
+
+    def write(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.snapshot(), f, indent=4, sort_keys=True)
+
+
+class DroppedLog(object):
+    # Tweets dropped for being late, written in the same form as the feed so the
+    # file can be replayed with --feed-file.
+    def __init__(self, output_file):
+        self.output_file = output_file
+        self.lock = threading.Lock()
+
+    def write(self, tweet):
+        with self.lock:
+            self.output_file.write(json.dumps(tweet, sort_keys=True) + '\n')
+            self.output_file.flush()
+
+
+def url_tweet(tweet_id, url):
+    return {'id': tweet_id, 'entities': {'urls': [{'expanded_url': url}]}}
+
+
+def tweet_urls(tweet):
+    return [u['expanded_url'] for u in tweet.get('entities', {}).get('urls', [])
+            if u.get('expanded_url')]
+
+
+def read_stage(feed, url_queue, num_consumers, metrics):
+    # put() blocks when url_queue is full, which stalls the feed (backpressure).
+    try:
+        for tweet in feed:
+            metrics.incr('tweets')
+            if 'retweeted_status' in tweet:
+                continue
+            url_queue.put((time.time(), tweet))
+    except Exception:
+        logging.exception('reading the feed failed')
+        metrics.incr('errors')
+    finally:
+        for _ in range(num_consumers):
+            url_queue.put(STOP)
+
+
+def url_stage(url_queue, fetch_queue, timeout, metrics, dropped_log=None):
+    import requests
+    while True:
+        item = url_queue.get()
+        if item is STOP:
+            return
+        start_time, tweet = item
+        try:
+            remaining = timeout - (time.time() - start_time)
+            if remaining <= 0:
+                if dropped_log is not None:
+                    logging.warning('dropping tweet {}, already over the target latency'.format(
+                        tweet.get('id')))
+                    metrics.incr('dropped')
+                    dropped_log.write(tweet)
+                    continue
+                remaining = LATE_TIMEOUT_SECONDS
+            urls = get_trainig_data.filter_non_twitter_urls(tweet_urls(tweet), timeout=remaining)
+        except requests.exceptions.RequestException:
+            logging.error('url expansion failed for tweet {}'.format(tweet.get('id')))
+            metrics.incr('fetch_errors')
+            continue
+        except Exception:
+            logging.exception('url stage failed for tweet {}'.format(tweet.get('id')))
+            metrics.incr('errors')
+            continue
+        for u in urls:
+            metrics.incr('urls')
+            fetch_queue.put((start_time, tweet['id'], u))
+
+
+def fetch_within(url, deadline):
+    # requests' timeout only bounds each connect and read, so a slow trickle could
+    # still take forever. Read the body in chunks and give up at the deadline.
+    import requests
+    response = requests.get(url, headers=get_trainig_data.HEADERS,
+                            timeout=max(deadline - time.time(), 0.001), stream=True)
+    try:
+        chunks = []
+        for chunk in response.iter_content(FETCH_CHUNK_SIZE):
+            chunks.append(chunk)
+            if time.time() > deadline:
+                return None
+        return b''.join(chunks)
+    finally:
+        response.close()
+
+
+def fetch_stage(fetch_queue, extract_queue, timeout, metrics, dropped_log=None):
+    import requests
+    while True:
+        item = fetch_queue.get()
+        if item is STOP:
+            return
+        start_time, tweet_id, url = item
+        deadline = start_time + timeout
+        if deadline <= time.time():
+            if dropped_log is not None:
+                logging.warning('dropping {}, already over the target latency'.format(url))
+                metrics.incr('dropped')
+                dropped_log.write(url_tweet(tweet_id, url))
+                continue
+            deadline = time.time() + LATE_TIMEOUT_SECONDS
+        try:
+            content = fetch_within(url, deadline)
+        except requests.exceptions.RequestException:
+            logging.error('request failed: {}'.format(url))
+            metrics.incr('fetch_errors')
+            continue
+        except Exception:
+            logging.exception('fetch stage failed for {}'.format(url))
+            metrics.incr('errors')
+            continue
+        if content is None:
+            logging.warning('dropping {}, download went over the target latency'.format(url))
+            metrics.incr('dropped')
+            if dropped_log is not None:
+                dropped_log.write(url_tweet(tweet_id, url))
+            continue
+        metrics.incr('pages')
+        extract_queue.put((start_time, tweet_id, url, content))
+
+
+def extract_stage(extract_queue, output_file, metrics, pool=None, templates=None):
+    while True:
+        item = extract_queue.get()
+        if item is STOP:
+            return
+        start_time, tweet_id, url, content = item
+        pollsters = []
+        try:
+            sentences = chunk_for_poll.get_possible_sentences_from_html(
+                content, url=url, templates=templates)
+            for pollster in chunk_for_poll.find_pollsters(sentences, pool=pool):
+                if pollster and pollster not in pollsters:
+                    pollsters.append(pollster)
+        except Exception:
+            logging.exception('extract stage failed for {}'.format(url))
+            metrics.incr('errors')
+            continue
+        latency = time.time() - start_time
+        metrics.record_latency(latency)
+        late = latency > metrics.target_latency
+        for pollster in pollsters:
+            metrics.incr('detections')
+            output_file.write(json.dumps({'tweet_id': tweet_id, 'url': url,
+                                          'pollster': pollster, 'latency': latency,
+                                          'late': late},
+                                         sort_keys=True) + '\n')
+        output_file.flush()
+
+
+def start_threads(target, args, count):
+    threads = [threading.Thread(target=target, args=args) for _ in range(count)]
+    for t in threads:
+        t.daemon = True
+        t.start()
+    return threads
+
+
+def run_pipeline(feed, output_file, target_latency=TARGET_LATENCY_SECONDS,
+                 queue_size=QUEUE_SIZE, num_fetch_workers=NUM_FETCH_WORKERS,
+                 metrics_file=None, pool=None, templates=None, dropped_log=None):
+    metrics = StreamMetrics(target_latency)
+    url_queue = queue.Queue(maxsize=queue_size)
+    fetch_queue = queue.Queue(maxsize=queue_size)
+    extract_queue = queue.Queue(maxsize=queue_size)
+    metrics.add_queue('url', url_queue)
+    metrics.add_queue('fetch', fetch_queue)
+    metrics.add_queue('extract', extract_queue)
+
+    reader = start_threads(read_stage, (feed, url_queue, NUM_URL_WORKERS, metrics), 1)
+    url_workers = start_threads(url_stage, (url_queue, fetch_queue, target_latency, metrics,
+                                            dropped_log), NUM_URL_WORKERS)
+    fetchers = start_threads(fetch_stage, (fetch_queue, extract_queue, target_latency, metrics,
+                                           dropped_log), num_fetch_workers)
+    # NLTK tagging is CPU bound, so a single extractor thread hands it to the pool if given.
+    extractor = start_threads(extract_stage, (extract_queue, output_file, metrics, pool,
+                                              templates), 1)
+
+    # Shut down one stage at a time so each sees all of the work from the one before it.
+    stages = [(reader, None, 0), (url_workers, fetch_queue, num_fetch_workers),
+              (fetchers, extract_queue, 1), (extractor, None, 0)]
+    next_report = time.time() + METRICS_INTERVAL_SECONDS
+    next_save = time.time() + TEMPLATE_SAVE_SECONDS
+    for threads, downstream, num_consumers in stages:
+        for t in threads:
+            while t.is_alive():
+                t.join(1.0)
+                if time.time() >= next_report:
+                    logging.info('stream metrics: {}'.format(metrics.snapshot()))
+                    if metrics_file:
+                        metrics.write(metrics_file)
+                    next_report = time.time() + METRICS_INTERVAL_SECONDS
+                # A live stream never finishes, so save what has been learned as we go.
+                if templates is not None and time.time() >= next_save:
+                    templates.save()
+                    next_save = time.time() + TEMPLATE_SAVE_SECONDS
+        for _ in range(num_consumers):
+            downstream.put(STOP)
+
+    if metrics_file:
+        metrics.write(metrics_file)
+    return metrics
+
+
+def main():
+    args = parseargs()
+    logging.info('starting...')
+    pool = None
+    if args.extract_processes > 0:
+        # Fork before any threads are started.
+        pool = chunk_for_poll.make_worker_pool(args.extract_processes)
+    else:
+        chunk_for_poll.preload_models()
+    templates = None
+    if args.body_templates:
+        templates = body_templates.BodyTemplates(args.body_templates)
+    if args.feed_file:
+        feed = file_feed(args.feed_file, follow=args.follow)
+    else:
+        import twitter
+        with open(args.secret_file) as f:
+            secrets = json.load(f)
+        api = twitter.Api(consumer_key=secrets['APIKey'],
+                          consumer_secret=secrets['APISecret'],
+                          access_token_key=secrets['AccessToken'],
+                          access_token_secret=secrets['AccessTokenSecret'])
+        feed = twitter_feed(api, args.term)
+
+    dropped_file = None
+    try:
+        dropped_log = None
+        if args.drop_late:
+            dropped_file = open(args.drop_late, 'a')
+            dropped_log = DroppedLog(dropped_file)
+        with open(args.output, 'a') as output_file:
+            metrics = run_pipeline(feed, output_file, target_latency=args.target_latency,
+                                   queue_size=args.queue_size,
+                                   num_fetch_workers=args.fetch_workers,
+                                   metrics_file=args.metrics_file, pool=pool,
+                                   templates=templates, dropped_log=dropped_log)
+    finally:
+        # Also reached on Ctrl-C, which is how a live stream is normally stopped.
+        if dropped_file is not None:
+            dropped_file.close()
+        if templates is not None:
+            templates.save()
+    if pool is not None:
+        pool.close()
+        pool.join()
+    logging.info('final stream metrics: {}'.format(metrics.snapshot()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+import body_templates
+
+NAV = 'html/body/div.nav/a'
+STORY = 'html/body/div.story/p'
+LIVE = 'html/body/article.live/p'
+FOOTER = 'html/body/footer'
+
+
+def story_page(i):
+    return [(NAV, 'Home'), (NAV, 'Politics'),
+            (STORY, 'Article {} paragraph one about a new poll with lots of words.'.format(i)),
+            (STORY, 'Second paragraph {} with more unique content here.'.format(i)),
+            (FOOTER, 'Copyright 2017 Site')]
+
+
+def live_page(i):
+    return [(NAV, 'Home'), (NAV, 'Politics'),
+            (LIVE, 'Live update {}: a new Marist survey has the race tied.'.format(i)),
+            (LIVE, 'Live update {}: more from the campaign trail today.'.format(i)),
+            (FOOTER, 'Copyright 2017 Site')]
+
+
+def fake_pages(monkeypatch):
+    # body_texts is handed the (path, text) list itself instead of html.
+    monkeypatch.setattr(body_templates, 'texts_with_paths', lambda texts: texts)
+
+
+def observed_stats(pages):
+    templates = body_templates.BodyTemplates()
+    for i, texts in enumerate(pages):
+        templates.observe('http://www.site.com/{}'.format(i), texts)
+    return templates.stats['site.com']
+
+
+def test_learn_body_paths_needs_min_pages():
+    stats = observed_stats([story_page(i) for i in range(body_templates.MIN_PAGES - 1)])
+    assert body_templates.learn_body_paths(stats) is None
+
+
+def test_learn_body_paths_skips_repeated_text():
+    stats = observed_stats([story_page(i) for i in range(5)])
+    assert body_templates.learn_body_paths(stats) == set([STORY])
+
+
+def test_prune_stats_forgets_old_single_page_text(monkeypatch):
+    monkeypatch.setattr(body_templates, 'KEEP_PAGES', 3)
+    stats = observed_stats([story_page(i) for i in range(5)] + [live_page(5)])
+    body_templates.prune_stats(stats)
+
+    # Only the last three pages' urls and page-specific text are kept.
+    assert sorted(stats['urls'].values()) == [4, 5, 6]
+    assert sorted(first_page for _, _, first_page in stats['paths'][STORY].values()) == [4, 4, 5, 5]
+    assert len(stats['paths'][LIVE]) == 2
+    # Text seen on many pages is kept however old it is.
+    assert len(stats['paths'][NAV]) == 2
+    assert len(stats['paths'][FOOTER]) == 1
+
+
+def test_prune_stats_drops_empty_paths(monkeypatch):
+    monkeypatch.setattr(body_templates, 'KEEP_PAGES', 1)
+    stats = observed_stats([live_page(0)] + [story_page(i) for i in range(1, 4)])
+    body_templates.prune_stats(stats)
+    assert LIVE not in stats['paths']
+
+
+def test_body_texts_uses_template_once_learned(monkeypatch):
+    fake_pages(monkeypatch)
+    templates = body_templates.BodyTemplates()
+    for i in range(body_templates.MIN_PAGES - 1):
+        assert templates.body_texts('http://site.com/{}'.format(i), story_page(i)) == [
+            text for _, text in story_page(i)]
+    texts = templates.body_texts('http://site.com/5', story_page(5))
+    assert texts == [text for path, text in story_page(5) if path == STORY]
+
+
+def test_body_texts_falls_back_for_other_layouts(monkeypatch):
+    fake_pages(monkeypatch)
+    templates = body_templates.BodyTemplates()
+    for i in range(5):
+        templates.body_texts('http://site.com/{}'.format(i), story_page(i))
+    texts = templates.body_texts('http://site.com/live', live_page(0))
+    assert texts == [text for _, text in live_page(0)]
+    assert any('Marist survey' in text for text in texts)
+
+
+def test_body_paths_relearned_on_doubling_schedule(monkeypatch):
+    fake_pages(monkeypatch)
+    templates = body_templates.BodyTemplates()
+    learned = []
+    for i in range(50):
+        templates.body_texts('http://site.com/{}'.format(i), story_page(i))
+        learned_at = templates.body_paths['site.com'][1]
+        if not learned or learned[-1] != learned_at:
+            learned.append(learned_at)
+    assert learned == [1, 2, 3, 6, 12, 24, 44]
@@ -0,0 +1,64 @@
+import random
+
+import pytest
+
+import bench_pollster_scan
+import chunk_for_poll
+
+tree = pytest.importorskip('nltk.tree')
+
+TAGS = ['NNP', 'NNPS', 'CC', 'VB', 'VBD', 'VBG', 'VBZ', 'JJS', 'DT', 'IN', 'NN', 'JJ']
+
+
+def random_parsed_sentence(rng):
+    # Chunked sentences with the tags the search cares about over-represented, and
+    # noun phrases with and without poll/survey in them.
+    parsed = []
+    for i in range(rng.randint(1, 14)):
+        if rng.random() < 0.25:
+            words = [(rng.choice(['poll', 'survey', 'race']), rng.choice(['NN', 'NNP']))]
+            if rng.random() < 0.3:
+                words.insert(0, ('the', 'DT'))
+            parsed.append(tree.Tree('NP', words))
+        else:
+            parsed.append(('W{}'.format(i), rng.choice(TAGS)))
+    return parsed
+
+
+def test_search_for_pollster_matches_tree_walk():
+    rng = random.Random(2017)
+    cases = 0
+    for _ in range(5000):
+        parsed = random_parsed_sentence(rng)
+        for i in range(len(parsed)):
+            for search_backwards in (True, False):
+                expected = bench_pollster_scan.tree_search_for_pollster(
+                    parsed, i, search_backwards=search_backwards)
+                assert chunk_for_poll.search_for_pollster(
+                    parsed, i, search_backwards=search_backwards) == expected, parsed
+                cases += 1
+    assert cases > 50000
+
+
+def test_poll_chunks_match_tree_walk():
+    rng = random.Random(2018)
+    for _ in range(5000):
+        parsed = random_parsed_sentence(rng)
+        assert bench_pollster_scan.array_search(parsed) == \
+            bench_pollster_scan.tree_search(parsed), parsed
+
+
+def test_search_for_pollster_examples():
+    parsed = [('A', 'DT'), ('new', 'JJ'), ('Quinnipiac', 'NNP'), ('University', 'NNP'),
+              tree.Tree('NP', [('poll', 'NN')]), ('shows', 'VBZ'), ('a', 'DT'),
+              ('tight', 'JJ'), ('race', 'NN')]
+    assert chunk_for_poll.search_for_pollster(parsed, 4) == ('Quinnipiac University', 1)
+    assert chunk_for_poll.search_for_pollster(parsed, 4, search_backwards=False) == (None, None)
+
+    parsed = [tree.Tree('NP', [('the', 'DT'), ('survey', 'NN')]), ('by', 'IN'),
+              ('Marist', 'NNP'), ('and', 'CC'), ('NBC', 'NNP'), ('News', 'NNP'),
+              ('found', 'VBD'), ('that', 'IN')]
+    assert chunk_for_poll.search_for_pollster(parsed, 0, search_backwards=False) == (None, None)
+    parsed[6] = ('in', 'IN')
+    assert chunk_for_poll.search_for_pollster(parsed, 0, search_backwards=False) == (
+        'Marist and NBC News', 2)
@@ -0,0 +1,205 @@
+import io
+import itertools
+import json
+import threading
+
+import pytest
+import requests
+
+import chunk_for_poll
+import stream_polls
+
+
+class FakeResponse(object):
+    def __init__(self, url):
+        self.url = url
+
+    def iter_content(self, chunk_size):
+        yield self.url.encode('utf-8')
+
+    def close(self):
+        pass
+
+
+BaseQueue = stream_polls.queue.Queue
+
+
+class RecordingQueue(BaseQueue):
+    # Remembers the deepest it ever got, to check that maxsize is respected.
+    created = []
+
+    def __init__(self, maxsize=0):
+        BaseQueue.__init__(self, maxsize=maxsize)
+        self.max_depth = 0
+        RecordingQueue.created.append(self)
+
+    def _put(self, item):
+        BaseQueue._put(self, item)
+        self.max_depth = max(self.max_depth, self._qsize())
+
+
+def write_feed(path, num_tweets, num_retweets=0):
+    with open(str(path), 'w') as f:
+        for i in range(num_tweets):
+            tweet = {'id': i, 'entities': {'urls': [
+                {'expanded_url': 'http://example.com/politics/article-{}'.format(i)},
+                {'expanded_url': 'https://twitter.com/i/web/status/{}'.format(i)}]}}
+            f.write(json.dumps(tweet) + '\n')
+        for i in range(num_retweets):
+            f.write(json.dumps({'id': 1000 + i, 'retweeted_status': {'id': i}}) + '\n')
+    return stream_polls.file_feed(str(path))
+
+
+@pytest.fixture
+def stub_extraction(monkeypatch):
+    fetched = []
+
+    def fake_get(url, **kwargs):
+        fetched.append(url)
+        return FakeResponse(url)
+
+    def fake_sentences(content, url=None, templates=None):
+        return [content.decode('utf-8').split('-')[-1]]
+
+    monkeypatch.setattr(requests, 'get', fake_get)
+    monkeypatch.setattr(chunk_for_poll, 'get_possible_sentences_from_html', fake_sentences)
+    monkeypatch.setattr(chunk_for_poll, 'find_pollsters',
+                        lambda sentences, pool=None: ['Pollster {}'.format(s) for s in sentences])
+    return fetched
+
+
+def run_with_timeout(feed, output, **kwargs):
+    # A hung pipeline should fail the test rather than the whole run.
+    result = {}
+    t = threading.Thread(target=lambda: result.update(
+        metrics=stream_polls.run_pipeline(feed, output, **kwargs)))
+    t.daemon = True
+    t.start()
+    t.join(30)
+    assert not t.is_alive(), 'pipeline did not shut down'
+    return result['metrics']
+
+
+def test_run_pipeline_writes_detections(tmpdir, stub_extraction):
+    feed = write_feed(tmpdir.join('feed.jsonl'), 20, num_retweets=5)
+    output = io.StringIO()
+    threads_before = threading.active_count()
+    metrics = run_with_timeout(feed, output, num_fetch_workers=3)
+
+    detections = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert sorted(d['tweet_id'] for d in detections) == list(range(20))
+    for d in detections:
+        assert d['pollster'] == 'Pollster {}'.format(d['tweet_id'])
+        assert d['url'] == 'http://example.com/politics/article-{}'.format(d['tweet_id'])
+        assert d['latency'] >= 0
+    # Twitter links are filtered out before fetching.
+    assert len(stub_extraction) == 20
+
+    snapshot = metrics.snapshot()
+    assert snapshot['tweets'] == 25
+    assert snapshot['pages'] == 20
+    assert snapshot['detections'] == 20
+    assert snapshot['errors'] == 0
+    assert snapshot['latency']['count'] == 20
+    assert snapshot['queue_depth'] == {'url': 0, 'fetch': 0, 'extract': 0}
+    # Every stage thread saw its STOP and exited.
+    assert threading.active_count() == threads_before
+
+
+def test_run_pipeline_queues_are_bounded(tmpdir, monkeypatch, stub_extraction):
+    RecordingQueue.created = []
+    monkeypatch.setattr(stream_polls.queue, 'Queue', RecordingQueue)
+    feed = write_feed(tmpdir.join('feed.jsonl'), 50)
+    output = io.StringIO()
+    run_with_timeout(feed, output, queue_size=2, num_fetch_workers=2)
+
+    assert len(output.getvalue().splitlines()) == 50
+    assert len(RecordingQueue.created) == 3
+    for q in RecordingQueue.created:
+        assert q.maxsize == 2
+        assert q.max_depth <= 2
+
+
+def test_run_pipeline_survives_stage_errors(tmpdir, monkeypatch, stub_extraction):
+    def flaky_sentences(content, url=None, templates=None):
+        if url.endswith('article-7'):
+            raise ValueError('bad page')
+        return [content.decode('utf-8').split('-')[-1]]
+
+    monkeypatch.setattr(chunk_for_poll, 'get_possible_sentences_from_html', flaky_sentences)
+    feed = write_feed(tmpdir.join('feed.jsonl'), 100)
+    output = io.StringIO()
+    metrics = run_with_timeout(feed, output, queue_size=2, num_fetch_workers=2)
+
+    tweet_ids = sorted(json.loads(line)['tweet_id'] for line in output.getvalue().splitlines())
+    assert tweet_ids == [i for i in range(100) if i != 7]
+    assert metrics.snapshot()['errors'] == 1
+
+
+def test_run_pipeline_keeps_late_tweets(tmpdir, stub_extraction):
+    feed = write_feed(tmpdir.join('feed.jsonl'), 10)
+    output = io.StringIO()
+    metrics = run_with_timeout(feed, output, target_latency=0)
+
+    detections = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert sorted(d['tweet_id'] for d in detections) == list(range(10))
+    assert all(d['late'] for d in detections)
+    assert metrics.snapshot()['dropped'] == 0
+
+
+def test_run_pipeline_drop_late_writes_replayable_tweets(tmpdir, stub_extraction):
+    feed = write_feed(tmpdir.join('feed.jsonl'), 10)
+    output = io.StringIO()
+    dropped = tmpdir.join('dropped.jsonl')
+    with open(str(dropped), 'w') as dropped_file:
+        metrics = run_with_timeout(feed, output, target_latency=0,
+                                   dropped_log=stream_polls.DroppedLog(dropped_file))
+    assert output.getvalue() == ''
+    assert metrics.snapshot()['dropped'] == 10
+
+    replay_output = io.StringIO()
+    run_with_timeout(stream_polls.file_feed(str(dropped)), replay_output)
+    detections = [json.loads(line) for line in replay_output.getvalue().splitlines()]
+    assert sorted(d['tweet_id'] for d in detections) == list(range(10))
+    assert not any(d['late'] for d in detections)
+
+
+class FlakyStreamApi(object):
+    # Each call to GetStreamFilter plays the next script: a list of tweets, which
+    # may end in an exception to raise.
+    def __init__(self, scripts):
+        self.scripts = list(scripts)
+        self.calls = 0
+
+    def GetStreamFilter(self, track):
+        self.calls += 1
+        for item in self.scripts.pop(0):
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+
+def test_twitter_feed_reconnects_with_backoff(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(stream_polls.time, 'sleep', sleeps.append)
+    api = FlakyStreamApi([
+        [{'id': 1}, IOError('connection reset')],
+        [IOError('connection refused')],
+        [{'limit': {'track': 3}}, {'id': 2}, {'disconnect': {'code': 7}}],
+        [{'id': 3}],
+    ])
+    tweets = list(itertools.islice(stream_polls.twitter_feed(api, 'new poll'), 3))
+
+    assert [t['id'] for t in tweets] == [1, 2, 3]
+    assert api.calls == 4
+    # Backoff doubles while reconnects fail and resets once tweets arrive again.
+    assert sleeps == [1.0, 2.0, 1.0]
+
+
+def test_twitter_feed_gives_up_after_max_retries(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(stream_polls.time, 'sleep', sleeps.append)
+    api = FlakyStreamApi([[IOError('down')]] * 3)
+    assert list(stream_polls.twitter_feed(api, 'new poll', max_retries=2)) == []
+    assert api.calls == 3
+    assert sleeps == [1.0, 2.0]